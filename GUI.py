@@ -85,6 +85,18 @@ class ABCFlowGUI(QWidget):
         self.run_btn.clicked.connect(self._on_run)
         layout.addRow(self.run_btn)
 
+        # Run button stylesheet while generating, p is the completed fraction
+        self._progress_style = (
+            "QPushButton {{"
+            "border: 1px solid #555;"
+            "border-radius: 4px;"
+            "padding: 5px;"
+            "color: black;"
+            "background: qlineargradient(x1:0, y1:0, x2:1, y2:0, "
+            "stop:0 green, stop:{p:.3f} green, stop:{q:.3f} lightgray, stop:1 lightgray);"
+            "}}"
+        )
+
         self.setLayout(layout)
 
     def _on_table_item_changed(self, item):
@@ -111,33 +123,27 @@ class ABCFlowGUI(QWidget):
             # parse inputs
             A = float(self.A_edit.text()); B = float(self.B_edit.text()); C = float(self.C_edit.text())
             N = int(self.N_edit.text())
-            # sinusoidal terms
-            epsilons, omegas, betas = [], [], []
-            for r in range(self.table.rowCount()):
-                items = [self.table.item(r, c) for c in range(3)]
-                if any(it is None or not it.text().strip() for it in items):
-                    break
-                epsilons.append(float(items[0].text())); omegas.append(float(items[1].text())); betas.append(float(items[2].text()))
+            # sinusoidal terms: read every cell once, keep complete rows, convert in one go
+            rows = [[it.text() if it is not None else "" for it in (self.table.item(r, c) for c in range(3))]
+                    for r in range(self.table.rowCount())]
+            valid = [row for row in rows if all(s.strip() for s in row)]
+            terms = np.array(valid, dtype=np.float64).reshape(-1, 3)
+            epsilons, omegas, betas = terms.T.tolist()
             a_list = [float(x) for x in self.a_list_edit.text().split(',') if x.strip()]
             t0 = float(self.tstart_edit.text()); t1 = float(self.tend_edit.text()); steps = int(self.nstep_edit.text())
             out = self.outdir_edit.text(); base = self.basename_edit.text().strip()
 
+            self._last_pct = -1
+
             def update_progress(done, total):
                 pct = int(done / total * 100)
-                self.run_btn.setText(f"{pct}%")
-                p = pct / 100.0
-                delta = 0.001
-                style = (
-                    "QPushButton {"
-                    "border: 1px solid #555;"
-                    "border-radius: 4px;"
-                    "padding: 5px;"
-                    "color: black;"
-                    "background: qlineargradient(x1:0, y1:0, x2:1, y2:0, "
-                    f"stop:0 green, stop:{p:.3f} green, stop:{min(p+delta,1.0):.3f} lightgray, stop:1 lightgray);"
-                    "}"
-                )
-                self.run_btn.setStyleSheet(style)
+                # Restyling the button is costly, only do it when the percentage changes
+                if pct != self._last_pct:
+                    self._last_pct = pct
+                    self.run_btn.setText(f"{pct}%")
+                    p = pct / 100.0
+                    delta = 0.001
+                    self.run_btn.setStyleSheet(self._progress_style.format(p=p, q=min(p+delta, 1.0)))
                 QApplication.processEvents()
 
             self.run_btn.setEnabled(False)
@@ -1,8 +1,355 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import math
+import struct
+import zlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
-from pyevtk.hl import gridToVTK
+
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:  # Numba is optional, fall back to the NumPy path
+    njit = None
+    prange = range
+
+try:
+    import zarr
+except ImportError:  # only needed for sink="zarr"
+    zarr = None
+
+try:
+    import cupy
+    import cupyx
+except ImportError:  # only needed for backend="cupy"
+    cupy = None
+
+
+# Compute backends. "auto" picks the first CPU backend installed, fastest
+# first; the GPU backend "cupy" is only used when asked for
+BACKENDS = ("numba", "numpy", "cupy")
+
+# Upper bound on the memory used by one batch of velocity frames
+BATCH_BYTES = 64 * 1024**2
+
+# Upper bound on the bytes of a frame slab filled at once by the NumPy path,
+# sized so all three components of a slab stay in L2 cache
+SLAB_BYTES = 1024**2
+
+# Threads writing VTK files while the next batch is computed
+WRITE_WORKERS = 4
+
+# Batch buffers in flight, so the writers never read a batch being recomputed
+RING_SIZE = 2
+
+# Uncompressed size of each zlib block in compressed VTR files
+ZLIB_BLOCK_SIZE = 1024**2
+
+
+# --------------------------------------------------
+# Numba kernel
+# --------------------------------------------------
+def _abc_series(out, coords, A, B, C, phs):
+    """
+    Fill out (n_frames x N x N x N x 3, z/y/x/component) with the frames of phases phs.
+
+    A whole batch of frames is computed without returning to the interpreter.
+    The grid is the same on every axis, so the shifted 1D tables
+    sin(coords+ph) and cos(coords+ph) serve all three components. All
+    arguments are float32, so with fastmath LLVM can vectorize the loops
+    in single precision.
+    """
+    n_frames = out.shape[0]
+    N = coords.shape[0]
+
+    tables = np.empty((n_frames, 2, N), dtype=np.float32)
+    for f in prange(n_frames):
+        for n in range(N):
+            tables[f, 0, n] = math.sin(coords[n] + phs[f])
+            tables[f, 1, n] = math.cos(coords[n] + phs[f])
+
+    # Parallelize over (frame, k) pairs so a batch of one frame still uses all threads
+    for fk in prange(n_frames * N):
+        f = fk // N
+        k = fk % N
+        s = tables[f, 0]
+        c = tables[f, 1]
+        for j in range(N):
+            for i in range(N):
+                out[f, k, j, i, 0] = A * (s[k] + c[j])
+                out[f, k, j, i, 1] = B * (s[i] + c[k])
+                out[f, k, j, i, 2] = C * (s[j] + c[i])
+
+
+abc_series = njit(parallel=True, fastmath=True, cache=True)(_abc_series) if njit else None
+
+
+# --------------------------------------------------
+# Helper functions
+# --------------------------------------------------
+def _phase_series(ts, epsilons, omegas, betas, a_list):
+    """
+    Phase phi(t) = sum_i epsilons[i]*sin(omegas[i]*t + betas[i]) + sum_j a_list[j]*t,
+    evaluated for all times ts at once.
+    """
+    eps = np.asarray(epsilons, dtype=np.float64)[:, None]
+    om = np.asarray(omegas, dtype=np.float64)[:, None]
+    be = np.asarray(betas, dtype=np.float64)[:, None]
+    sinusoidal = (eps * np.sin(om * ts[None, :] + be)).sum(axis=0)
+    linear = np.sum(a_list) * ts
+    return sinusoidal + linear
+
+
+# Shapes that broadcast a 1D table along the z, y or x axis (0, 1, 2) of a
+# (z, y, x) ordered N^3 grid
+_AXIS_SHAPES = ((-1, 1, 1), (1, -1, 1), (1, 1, -1))
+
+# Axes of the sin and cos terms of each velocity component:
+# vx = A*(sin(z+ph) + cos(y+ph)), vy = B*(sin(x+ph) + cos(z+ph)), vz = C*(sin(y+ph) + cos(x+ph))
+_COMPONENT_AXES = ((0, 1), (2, 0), (1, 2))
+
+
+def _resolve_backend(backend):
+    """Return the compute backend to use for backend ("auto" or one of BACKENDS)."""
+    available = {"numba": abc_series is not None, "numpy": True, "cupy": cupy is not None}
+    if backend == "auto":
+        return next(name for name in BACKENDS if name != "cupy" and available[name])
+    if backend not in available:
+        raise ValueError(f"Unknown backend '{backend}', expected 'auto' or one of: {', '.join(BACKENDS)}")
+    if not available[backend]:
+        raise ValueError(f"Backend '{backend}' requires the {backend} package")
+    return backend
+
+
+def _make_grid(N, backend):
+    """
+    Return the 1D grid coordinates and the backend's compute state: None for
+    Numba, the cached (sin(coords), cos(coords)) tables for NumPy, and for
+    CuPy those tables on the device plus a double-buffered device frame and
+    a compute and a copy stream.
+    """
+    L = 2.0 * np.pi
+    coords = np.linspace(0.0, L, N, dtype=np.float32)
+    if backend == "numba":
+        return coords, None
+    # The grid is the same on every axis, so one pair of tables serves x, y and z
+    trig = (np.sin(coords), np.cos(coords))
+    if backend == "cupy":
+        trig = (cupy.asarray(trig[0]), cupy.asarray(trig[1]),
+                cupy.empty((2, N, N, N, 3), dtype=np.float32),
+                cupy.cuda.Stream(non_blocking=True), cupy.cuda.Stream(non_blocking=True))
+    return coords, trig
+
+
+def _empty_frames(shape, backend):
+    """Host frame buffers; page-locked for CuPy so device copies run asynchronously."""
+    if backend == "cupy":
+        return cupyx.empty_pinned(shape, dtype=np.float32)
+    return np.empty(shape, dtype=np.float32)
+
+
+def _fill_batch(batch, k0, coords, trig, params, backend):
+    """
+    Fill batch (n_frames x N x N x N x 3) with time steps k0 .. k0+n_frames-1.
+
+    Each frame is stored z/y/x/component, which is the point order of a VTK
+    "velocity" vector array, so frames can be written out as they are. The
+    Numba kernel works one z plane at a time; the NumPy path fills slabs of
+    at most SLAB_BYTES.
+
+    params is (A, B, C, ph_all) with ph_all the float32 phase of every time step;
+    trig holds the tables from _make_grid for the same backend.
+    """
+    A, B, C, ph_all = params
+    phs = ph_all[k0:k0 + batch.shape[0]]
+    if backend == "numba":
+        abc_series(batch, coords, A, B, C, phs)
+        return
+    if backend == "cupy":
+        _fill_batch_gpu(batch, trig, A, B, C, phs)
+        return
+
+    sin_c, cos_c = trig
+    N = coords.shape[0]
+    # z planes per slab: each component is a strided pass over the interleaved
+    # frame, so the three passes are done slab by slab while it is still cached
+    slab = max(1, SLAB_BYTES // batch[0, 0].nbytes)
+    for ph, frame in zip(phs, batch):
+        # Since the phase is a scalar, sin(x+ph) = sin(x)cos(ph) + cos(x)sin(ph) and
+        # cos(x+ph) = cos(x)cos(ph) - sin(x)sin(ph): the shifted tables come from the
+        # cached ones with N multiply-adds, and no N^3 transcendentals are evaluated.
+        sp, cp = np.float32(math.sin(ph)), np.float32(math.cos(ph))
+        sin_ph = sin_c * cp + cos_c * sp
+        cos_ph = cos_c * cp - sin_c * sp
+        # Every component uses the same two shifted tables, along different axes
+        terms = [(v, (coef * sin_ph).reshape(_AXIS_SHAPES[a]), (coef * cos_ph).reshape(_AXIS_SHAPES[b]))
+                 for v, coef, (a, b) in zip(np.moveaxis(frame, -1, 0), (A, B, C), _COMPONENT_AXES)]
+
+        for z0 in range(0, N, slab):
+            z1 = z0 + slab
+            for v, sin_a, cos_b in terms:
+                # Only tables running along z are cut to the slab
+                sin_a = sin_a[z0:z1] if sin_a.shape[0] > 1 else sin_a
+                cos_b = cos_b[z0:z1] if cos_b.shape[0] > 1 else cos_b
+                # Outer sum of the two 1D tables, broadcast straight into the frame
+                np.add(sin_a, cos_b, out=v[z0:z1])
+
+
+def _fill_batch_gpu(batch, gpu, A, B, C, phs):
+    """
+    CuPy version of _fill_batch: each frame is computed on the device and copied
+    into the (page-locked) host batch. Two device frames alternate, so the copy
+    stream transfers frame f while the compute stream works on frame f+1; the
+    disk writes of the previous batch run meanwhile on the writer threads.
+    """
+    sin_c, cos_c, d_frames, compute, copy = gpu
+    copied = [None, None]
+    for f, (ph, frame) in enumerate(zip(phs, batch)):
+        d_frame = d_frames[f % 2]
+        sp, cp = np.float32(math.sin(ph)), np.float32(math.cos(ph))
+        with compute:
+            # The device frame must not be overwritten before its previous copy is done
+            if copied[f % 2] is not None:
+                compute.wait_event(copied[f % 2])
+            sin_ph = sin_c * cp + cos_c * sp
+            cos_ph = cos_c * cp - sin_c * sp
+            for c, (coef, (a, b)) in enumerate(zip((A, B, C), _COMPONENT_AXES)):
+                cupy.add((coef * sin_ph).reshape(_AXIS_SHAPES[a]),
+                         (coef * cos_ph).reshape(_AXIS_SHAPES[b]), out=d_frame[..., c])
+            ready = compute.record()
+        copy.wait_event(ready)
+        d_frame.get(stream=copy, out=frame, blocking=False)
+        copied[f % 2] = copy.record()
+    copy.synchronize()
+
+
+# --------------------------------------------------
+# VTK output
+# --------------------------------------------------
+_BYTE_ORDER = "LittleEndian" if sys.byteorder == "little" else "BigEndian"
+
+
+def _zlib_blocks(data, level):
+    """
+    Compress data as a vtkZLibDataCompressor stream: a UInt64 header
+    [#blocks, block size, last partial block size, compressed sizes...]
+    followed by the independently compressed blocks.
+    """
+    data = memoryview(data).cast("B")
+    blocks = [zlib.compress(data[i:i + ZLIB_BLOCK_SIZE], level)
+              for i in range(0, data.nbytes, ZLIB_BLOCK_SIZE)]
+    header = struct.pack(f"={3 + len(blocks)}Q", len(blocks), ZLIB_BLOCK_SIZE,
+                         data.nbytes % ZLIB_BLOCK_SIZE, *map(len, blocks))
+    return [header] + blocks
+
+
+def _appended_block(data, compress):
+    """Bytes of one appended data array, zlib compressed at level compress if set."""
+    if compress:
+        return b"".join(_zlib_blocks(data, compress))
+    return struct.pack("=Q", data.nbytes) + data.tobytes()
+
+
+def _vtr_prefix(x_coords, y_coords, z_coords, compress=None):
+    """
+    Return what precedes the velocity block in every VTR file of the series:
+    the XML header and the appended coordinate arrays. Only the velocity
+    changes from frame to frame, so this is built once per run.
+    """
+    extent = f"0 {len(x_coords) - 1} 0 {len(y_coords) - 1} 0 {len(z_coords) - 1}"
+    compressor = ' compressor="vtkZLibDataCompressor"' if compress else ""
+    arrays = []
+    offset = 0
+    coord_arrays = []
+    for name, arr in (("x", x_coords), ("y", y_coords), ("z", z_coords)):
+        arrays.append(f'<DataArray Name="{name}_coordinates" NumberOfComponents="1" '
+                      f'type="Float32" format="appended" offset="{offset}"/>\n')
+        coord_arrays.append(_appended_block(arr, compress))
+        offset += len(coord_arrays[-1])
+    header = (
+        '<?xml version="1.0"?>\n'
+        f'<VTKFile type="RectilinearGrid" version="1.0" byte_order="{_BYTE_ORDER}" '
+        f'header_type="UInt64"{compressor}>\n'
+        f'<RectilinearGrid WholeExtent="{extent}">\n'
+        f'<Piece Extent="{extent}">\n'
+        '<Coordinates>\n'
+        + "".join(arrays) +
+        '</Coordinates>\n'
+        '<PointData Vectors="velocity">\n'
+        '<DataArray Name="velocity" NumberOfComponents="3" '
+        f'type="Float32" format="appended" offset="{offset}"/>\n'
+        '</PointData>\n'
+        '</Piece>\n'
+        '</RectilinearGrid>\n'
+        '<AppendedData encoding="raw">\n'
+        '_'
+    )
+    return header.encode("ascii") + b"".join(coord_arrays)
+
+
+def _write_vtr(path, prefix, frame, compress=None):
+    """
+    Write one frame (N x N x N x 3 float32, C-contiguous) as an appended VTR file.
+    prefix must come from _vtr_prefix with the same compress setting.
+    """
+    with open(path, "wb") as f:
+        f.write(prefix)
+        if compress:
+            f.writelines(_zlib_blocks(frame, compress))
+        else:
+            f.write(struct.pack("=Q", frame.nbytes))
+            f.write(frame.data)
+        f.write(b"\n</AppendedData>\n</VTKFile>\n")
+
+
+# --------------------------------------------------
+# Other sinks
+# --------------------------------------------------
+def _velocity_views(frame):
+    """vx, vy, vz of a (z, y, x, component) frame as views indexed [x, y, z]."""
+    return tuple(frame[..., c].T for c in range(3))
+
+
+def _write_zarr(store, k, frame):
+    """Store frame as time step k of a (n_step, 3, N, N, N) Zarr array."""
+    for c, v in enumerate(_velocity_views(frame)):
+        store[k, c] = v
+
+
+# --------------------------------------------------
+# Process pool workers
+# --------------------------------------------------
+# Per-process state, set up once by _init_worker so no N^3 arrays are pickled
+_worker = {}
+
+
+def _init_worker(N, params, outdir, basename, compress, backend, zarr_path):
+    if njit:
+        # The processes already provide the parallelism
+        set_num_threads(1)
+    coords, trig = _make_grid(N, backend)
+    _worker.update(
+        coords=coords, trig=trig, params=params, backend=backend,
+        outdir=outdir, basename=basename, compress=compress,
+        prefix=_vtr_prefix(coords, coords, coords, compress),
+        frame=_empty_frames((1, N, N, N, 3), backend),
+        store=zarr.open(zarr_path, mode="r+") if zarr_path else None,
+    )
+
+
+def _frame_worker(k):
+    """Compute time step k and write it to its VTK file or the Zarr store."""
+    w = _worker
+    _fill_batch(w["frame"], k, w["coords"], w["trig"], w["params"], w["backend"])
+    if w["store"] is not None:
+        _write_zarr(w["store"], k, w["frame"][0])
+    else:
+        _write_vtr(os.path.join(w["outdir"], f"{w['basename']}_{k:04d}.vtr"),
+                   w["prefix"], w["frame"][0], w["compress"])
+
 
 # --------------------------------------------------
 # Function definition
@@ -12,7 +359,11 @@ def generate_abc_flow(N, A, B, C,
                       a_list,
                       t_start, t_end, n_step,
                       outdir, basename,
-                      progress_callback=None):
+                      progress_callback=None,
+                      workers=1,
+                      compress=None,
+                      backend="auto",
+                      sink="vtk"):
     """
     Generate a time-dependent ABC flow VTK series with multi-component phase.
 
@@ -28,64 +379,142 @@ def generate_abc_flow(N, A, B, C,
         n_step  (int): number of time steps
         outdir   (str): output directory
         basename (str): base name for VTK files
+        workers  (int): processes computing and writing time steps in parallel;
+                        1 keeps the work in this process, overlapping writes with threads;
+                        > 1 spawns the processes, so a calling script must guard its
+                        entry point with `if __name__ == "__main__":`
+        compress (int): zlib level (1-9) for the VTR data, compressed on the writer
+                        threads; None writes uncompressed files
+        backend  (str): "numba", "numpy" or "cupy" (GPU); "auto" uses the
+                        first CPU backend installed
+        sink     (str or callable): where the frames go. "vtk" writes a VTR series and its PVD index;
+                        "zarr" writes a (n_step, 3, N, N, N) float32 array to
+                        <outdir>/<basename>.zarr, one chunk per component and time step;
+                        a callable is called as sink(k, t, vx, vy, vz) in this process
+                        with [x, y, z] indexed views that are only valid during the call
     """
-    # Phase function phi(t) = sum_i epsilons[i]*sin(omegas[i]*t + betas[i]) + sum_j a_list[j]*t
-    def phi(t):
-        sinusoidal = sum(eps * np.sin(omega * t + beta)
-                         for eps, omega, beta in zip(epsilons, omegas, betas))
-        linear = sum(a * t for a in a_list)
-        return sinusoidal + linear
+    if not (callable(sink) or sink in ("vtk", "zarr")):
+        raise ValueError(f"Unknown sink '{sink}', expected 'vtk', 'zarr' or a callable")
+    if sink == "zarr" and zarr is None:
+        raise ValueError("sink 'zarr' requires the zarr package")
+    if callable(sink) and workers > 1:
+        raise ValueError("A callable sink runs in this process and cannot be used with workers > 1")
 
     # Create grid
-    L = 2.0 * np.pi
-    coords = np.linspace(0.0, L, N, dtype=np.float32)
-    x3d, y3d, z3d = np.meshgrid(coords, coords, coords, indexing="ij")
-    x_coords = coords.astype(np.float32)
-    y_coords = coords.astype(np.float32)
-    z_coords = coords.astype(np.float32)
+    backend = _resolve_backend(backend)
+    coords, trig = _make_grid(N, backend)
+    # coords is already float32 and is only read from here on, so all axes share it
+    x_coords = y_coords = z_coords = coords
+
+    prefix = _vtr_prefix(x_coords, y_coords, z_coords, compress)
 
     # Prepare output folder
     os.makedirs(outdir, exist_ok=True)
 
     dt = (t_end - t_start) / n_step
-    vtr_names = []
-    times = []
+    vtr_names = [f"{basename}_{k:04d}.vtr" for k in range(n_step)]
+    times = t_start + np.arange(n_step) * dt
+
+    # Phase of every time step, computed up front. Everything the kernels touch
+    # is float32, so no step of the N^3 compute is promoted to float64.
+    ph_all = _phase_series(times, epsilons, omegas, betas, a_list).astype(np.float32)
+    params = (np.float32(A), np.float32(B), np.float32(C), ph_all)
 
-    for k in range(n_step):
+    store = zarr_path = None
+    if sink == "zarr":
+        zarr_path = os.path.join(outdir, f"{basename}.zarr")
+        store = zarr.open(zarr_path, mode="w", shape=(n_step, 3, N, N, N),
+                          chunks=(1, 1, N, N, N), dtype="f4")
+        store.attrs["times"] = times.tolist()
 
+    if workers > 1:
+        # Time steps are independent: each process computes and writes its own frames.
+        # Spawn rather than fork: a child forked after the parallel Numba kernel has
+        # run inherits its TBB thread pool and hangs on exit
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initargs=(N, params, outdir, basename, compress, backend, zarr_path)) as ex:
+            for i, _ in enumerate(ex.map(_frame_worker, range(n_step), chunksize=4)):
+                if progress_callback:
+                    progress_callback(i+1, n_step)
+    else:
+        # Preallocate a ring of velocity frame batches, reused for every batch
+        n_batch = max(1, min(n_step, BATCH_BYTES // (3 * 4 * N**3)))
         if progress_callback:
-            progress_callback(k+1, n_step)
-
-        t = t_start + k * dt
-        ph = phi(t)
-
-        # Velocity components with time-dependent phase
-        vx = A * (np.sin(z3d + ph) + np.cos(y3d + ph))
-        vy = B * (np.sin(x3d + ph) + np.cos(z3d + ph))
-        vz = C * (np.sin(y3d + ph) + np.cos(x3d + ph))
-
-        fname = f"{basename}_{k:04d}"
-        gridToVTK(
-            os.path.join(outdir, fname),
-            x_coords, y_coords, z_coords,
-            pointData={"velocity": (vx, vy, vz)}
-        )
-
-        vtr_names.append(f"{fname}.vtr")
-        times.append(t)
-
-    # Write PVD index file
-    pvd_path = os.path.join(outdir, f"{basename}_series.pvd")
-    with open(pvd_path, "w", encoding="utf-8") as f:
-        f.write('<?xml version="1.0"?>\n')
-        f.write('<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">\n')
-        f.write('  <Collection>\n')
-        for name, t in zip(vtr_names, times):
-            f.write(f'    <DataSet timestep="{t:.6f}" group="" part="0" file="{name}"/>\n')
-        f.write('  </Collection>\n')
-        f.write('</VTKFile>\n')
-
-    print(f"Generated {len(vtr_names)} time steps in '{outdir}'")
+            # Keep batches to about 1% of the run, so progress advances in small
+            # steps instead of waiting for a whole batch to be computed
+            n_batch = min(n_batch, max(1, n_step // 100))
+        n_ring = min(RING_SIZE, -(-n_step // n_batch))
+        ring = _empty_frames((n_ring, n_batch, N, N, N, 3), backend)
+
+        # Futures of the writes still reading from each ring slot, oldest first
+        pending = deque()
+        # Writes not yet passed to progress_callback, in submission order
+        unreported = deque()
+        n_done = 0
+
+        def report():
+            nonlocal n_done
+            n_done += 1
+            if progress_callback:
+                progress_callback(n_done, n_step)
+
+        def poll():
+            # Report every write finished so far, in order, without waiting
+            while unreported and unreported[0].done():
+                unreported.popleft().result()
+                report()
+
+        def drain(futures):
+            # The slot's writes are the oldest unreported ones, so each is
+            # reported as soon as it finishes
+            for fut in futures:
+                fut.result()
+                poll()
+
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+            for b, k0 in enumerate(range(0, n_step, n_batch)):
+                # Wait until the writers are done with the slot about to be overwritten
+                if len(pending) == n_ring:
+                    drain(pending.popleft())
+                batch = ring[b % n_ring, :min(n_batch, n_step - k0)]
+
+                # Velocity components with time-dependent phase
+                _fill_batch(batch, k0, coords, trig, params, backend)
+                # The previous batch was being written meanwhile
+                poll()
+
+                futures = []
+                for f, frame in enumerate(batch):
+                    k = k0 + f
+                    if callable(sink):
+                        sink(k, times[k], *_velocity_views(frame))
+                        report()
+                    elif store is not None:
+                        futures.append(pool.submit(_write_zarr, store, k, frame))
+                    else:
+                        futures.append(pool.submit(_write_vtr, os.path.join(outdir, vtr_names[k]),
+                                                   prefix, frame, compress))
+                pending.append(futures)
+                unreported.extend(futures)
+
+            while pending:
+                drain(pending.popleft())
+
+    if sink == "vtk":
+        # Write PVD index file
+        pvd_path = os.path.join(outdir, f"{basename}_series.pvd")
+        header = ('<?xml version="1.0"?>\n'
+                  '<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">\n'
+                  '  <Collection>\n')
+        footer = ('  </Collection>\n'
+                  '</VTKFile>\n')
+        lines = [f'    <DataSet timestep="{t:.6f}" group="" part="0" file="{name}"/>\n'
+                 for name, t in zip(vtr_names, times)]
+        with open(pvd_path, "w", encoding="utf-8") as f:
+            f.write(header + "".join(lines) + footer)
+
+    print(f"Generated {n_step} time steps in '{outdir}'")
 
 
 # --------------------------------------------------